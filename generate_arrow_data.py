@@ -8,15 +8,21 @@ This script runs the three specialized converters to create:
 - Boundaries data (from plane*.tsv files)
 
 All files are generated with uncompressed format for browser compatibility.
+The converters read and write disjoint directories, so they run concurrently.
 """
 
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 def run_converter(script_path, description):
-    """Run a converter script with uncompressed format."""
-    print(f"\n {description}...")
+    """Run a converter script with uncompressed format.
+
+    Returns (success, report). The report is printed by the caller so the
+    output of concurrently running converters does not interleave.
+    """
+    lines = [f"\n {description}..."]
     try:
         result = subprocess.run([
             sys.executable, script_path,
@@ -25,22 +31,22 @@ def run_converter(script_path, description):
 
         # Print the output
         if result.stdout:
-            print(result.stdout)
+            lines.append(result.stdout)
 
-        print(f" {description} completed successfully")
-        return True
+        lines.append(f" {description} completed successfully")
+        return True, "\n".join(lines)
 
     except subprocess.CalledProcessError as e:
-        print(f" {description} failed:")
-        print(f"Exit code: {e.returncode}")
+        lines.append(f" {description} failed:")
+        lines.append(f"Exit code: {e.returncode}")
         if e.stdout:
-            print("STDOUT:", e.stdout)
+            lines.append(f"STDOUT: {e.stdout}")
         if e.stderr:
-            print("STDERR:", e.stderr)
-        return False
+            lines.append(f"STDERR: {e.stderr}")
+        return False, "\n".join(lines)
     except Exception as e:
-        print(f" {description} failed with error: {e}")
-        return False
+        lines.append(f" {description} failed with error: {e}")
+        return False, "\n".join(lines)
 
 def main():
     print(" Generating Arrow data files for transcriptomics viewer...")
@@ -54,13 +60,22 @@ def main():
 
     success_count = 0
 
+    runnable = []
     for script_path, description in converters:
         if not Path(script_path).exists():
             print(f" Script not found: {script_path}")
             continue
+        runnable.append((script_path, description))
 
-        if run_converter(script_path, description):
-            success_count += 1
+    # Wall time is the slowest converter rather than the sum of all three
+    with ThreadPoolExecutor(max_workers=max(1, len(runnable))) as pool:
+        futures = [pool.submit(run_converter, script_path, description)
+                   for script_path, description in runnable]
+        for future in futures:
+            ok, report = future.result()
+            print(report)
+            if ok:
+                success_count += 1
 
     print(f"\n Summary:")
     print(f"   Converters run: {len(converters)}")
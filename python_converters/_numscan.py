@@ -0,0 +1,113 @@
+"""
+Shared Numba helpers for scanning JSON numbers out of raw bytes.
+
+Used by the boundaries (coords) and spots (neighbour lists) converters so
+both round exactly like json.loads followed by a float32 cast. Without
+numba the functions stay plain Python and the converters use their JSON
+paths instead.
+"""
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # optional: the converters then skip their Numba scanners
+    njit = None
+
+# Exact powers of ten for scan_number (all representable in float64)
+POW10 = np.array([10.0 ** k for k in range(23)])
+
+
+def skip_ws(buf, i):
+    n = buf.shape[0]
+    while i < n and (buf[i] == 32 or buf[i] == 9 or buf[i] == 10 or buf[i] == 13):
+        i += 1
+    return i
+
+
+def scan_number(buf, i):
+    """Parse a JSON number starting at buf[i]; returns (value, next index, ok).
+
+    Only numbers with at most 18 significant digits and a decimal exponent
+    within +-22 are accepted; value = mantissa * or / 10**k is then within two
+    float64 ulps of the correctly rounded result (see near_float32_tie).
+    """
+    n = buf.shape[0]
+    neg = False
+    if i < n and buf[i] == 45:  # '-'
+        neg = True
+        i += 1
+    mant = 0
+    digits = 0
+    exp10 = 0
+    is_float = False
+    start = i
+    while i < n and 48 <= buf[i] <= 57:
+        mant = mant * 10 + (int(buf[i]) - 48)
+        if mant:  # leading zeros are not significant
+            digits += 1
+        i += 1
+    # JSON forbids empty integer parts and leading zeros
+    if i == start or (i - start > 1 and buf[start] == 48):
+        return 0.0, i, False
+    if i < n and buf[i] == 46:  # '.'
+        is_float = True
+        i += 1
+        start = i
+        while i < n and 48 <= buf[i] <= 57:
+            mant = mant * 10 + (int(buf[i]) - 48)
+            if mant:
+                digits += 1
+            exp10 -= 1
+            i += 1
+        if i == start:
+            return 0.0, i, False
+    if i < n and (buf[i] == 101 or buf[i] == 69):  # 'e' / 'E'
+        is_float = True
+        i += 1
+        eneg = False
+        if i < n and (buf[i] == 43 or buf[i] == 45):  # '+' / '-'
+            eneg = buf[i] == 45
+            i += 1
+        e = 0
+        start = i
+        while i < n and 48 <= buf[i] <= 57 and e < 1000:
+            e = e * 10 + (int(buf[i]) - 48)
+            i += 1
+        if i == start:
+            return 0.0, i, False
+        exp10 += -e if eneg else e
+    if digits > 18 or exp10 < -22 or exp10 > 22:
+        return 0.0, i, False
+    val = float(mant)
+    if exp10 < 0:
+        val = val / POW10[-exp10]
+    elif exp10 > 0:
+        val = val * POW10[exp10]
+    # json.loads reads "-0" as the integer 0, not as -0.0
+    return (-val if neg and (is_float or mant != 0) else val), i, True
+
+
+def near_float32_tie(v):
+    """True if float32 rounding of v could differ from that of the exact decimal.
+
+    scan_number may be off by up to two float64 ulps, which only matters
+    when v lies that close to a float32 rounding boundary (or outside the
+    normal float32 range); such items are left to the JSON path.
+    """
+    a = abs(v)
+    if a == 0.0:
+        return False
+    if a < 1.2e-38 or a > 3.4e38:
+        return True
+    e = math.frexp(a)[1]
+    r = float(np.float32(a))
+    return abs(abs(a - r) - math.ldexp(1.0, e - 25)) <= math.ldexp(1.0, e - 51)
+
+
+# Compiled once per process (and cached on disk)
+if njit is not None:
+    skip_ws = njit(cache=True, nogil=True)(skip_ws)
+    scan_number = njit(cache=True, nogil=True)(scan_number)
+    near_float32_tie = njit(cache=True, nogil=True)(near_float32_tie)
@@ -17,17 +17,53 @@ We produce one row per polygon with variable-length list columns:
 
 Sharding: one Feather file per plane (mirrors input plane_XX.tsv). Manifest lists
 each plane file with its plane_id and polygon count. Use uncompressed by default
-for Arrow JS compatibility.
+for Arrow JS compatibility; --output-variant both additionally writes an
+LZ4-compressed *.lz4.feather sibling per plane (listed as lz4_url) for
+non-browser consumers.
+
+With --layout single all planes go into one Arrow IPC stream (boundaries.arrows),
+one record batch per plane. The manifest then also records schema_length and a
+byte offset/length per plane, so a client can fetch a single plane with HTTP
+Range requests: bytes [0, schema_length) + [offset, offset + length) form a
+valid stream on their own.
+
+--dictionary-labels (per-plane layout only) stores label as
+dictionary<int32, int32> with one dictionary per shard; the manifest then
+carries label_dictionary_unified: false. The browser viewer reads plain int32.
+
+--cache-coords memoizes parsing of identical coords strings within a worker
+process (off by default: every entry keeps both the string and the parsed
+array, and repeats across planes are rare when planes go to different workers).
 """
 import argparse
 import json
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List, Tuple
+from typing import Optional, Tuple
 
-import pandas as pd
+import numpy as np
 import pyarrow as pa
-import pyarrow.feather as feather
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from _numscan import near_float32_tie, scan_number, skip_ws
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib parser
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # optional: coords then go through the JSON parser only
+    njit = None
+
+# orjson's SIMD tokenizer is several times faster on the large coords strings
+json_loads = orjson.loads if orjson is not None else json.loads
 
 
 def build_argparser():
@@ -41,6 +77,37 @@ def build_argparser():
         choices=["uncompressed", "none", "zstd", "lz4"],
         help="Feather v2 compression. Use uncompressed/none for best browser support."
     )
+    p.add_argument(
+        "--output-variant",
+        default="browser",
+        choices=["browser", "both"],
+        help="'both' also writes an LZ4-compressed *.lz4.feather sibling per shard "
+             "(not readable by the browser viewer)."
+    )
+    p.add_argument(
+        "--layout",
+        default="per-plane",
+        choices=["per-plane", "single"],
+        help="'single' writes every plane into one IPC stream file with per-plane byte ranges "
+             "in the manifest (the viewer then downloads the whole file)."
+    )
+    p.add_argument(
+        "--dictionary-labels",
+        action="store_true",
+        help="Store label as dictionary<int32, int32> (not readable by the browser viewer)."
+    )
+    p.add_argument(
+        "--cache-coords",
+        action="store_true",
+        help=f"Memoize parsing of repeated coords strings (up to {COORDS_CACHE_SIZE} per worker, "
+             "several KB each); the per-plane log then reports cache hits."
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes converting planes in parallel (1 = serial)"
+    )
     return p
 
 
@@ -48,22 +115,326 @@ def ensure_outdir(path: Path):
     path.mkdir(parents=True, exist_ok=True)
 
 
-def parse_coords(cell: str) -> List[Tuple[float, float]]:
-    """Parse a JSON-like coords string '[[x,y], ...]' into a list of (x,y)."""
-    if pd.isna(cell):
-        return []
+SINGLE_FILE_NAME = "boundaries.arrows"
+
+# Sibling shards for local/server consumers that can decode compressed IPC
+LZ4_SUFFIX = ".lz4.feather"
+LZ4_CHUNKSIZE = 65536
+
+# With --cache-coords, identical coords strings (e.g. the same outline
+# repeated on several planes) are parsed once per worker process.
+COORDS_CACHE_SIZE = 200_000
+
+
+def _scan_xy_pairs(buf):
+    """Parse '[[x, y], ...]' from raw bytes into an (N, 2) float32 array.
+
+    Hand-written scanner for the common, well-formed case. Returns
+    (coords, ok); on anything unexpected ok is False and the caller falls
+    back to the JSON parser.
+    """
+    n = buf.shape[0]
+    # Upper bound on the number of pairs: every pair opens with '['
+    n_open = 0
+    for k in range(n):
+        if buf[k] == 91:  # '['
+            n_open += 1
+    out = np.empty((max(n_open - 1, 0), 2), dtype=np.float32)
+    fail = (out[:0], False)
+
+    i = skip_ws(buf, 0)
+    if i >= n or buf[i] != 91:
+        return fail
+    i = skip_ws(buf, i + 1)
+    count = 0
+    if i < n and buf[i] == 93:  # ']': empty outer list
+        i += 1
+    else:
+        while True:
+            if i >= n or buf[i] != 91:
+                return fail
+            x, i, ok = scan_number(buf, skip_ws(buf, i + 1))
+            i = skip_ws(buf, i)
+            if not ok or near_float32_tie(x) or i >= n or buf[i] != 44:  # ','
+                return fail
+            y, i, ok = scan_number(buf, skip_ws(buf, i + 1))
+            i = skip_ws(buf, i)
+            if not ok or near_float32_tie(y) or i >= n or buf[i] != 93:  # ']'
+                return fail
+            out[count, 0] = x
+            out[count, 1] = y
+            count += 1
+            i = skip_ws(buf, i + 1)
+            if i < n and buf[i] == 44:  # ',': another pair follows
+                i = skip_ws(buf, i + 1)
+            elif i < n and buf[i] == 93:  # ']' closes the outer list
+                i += 1
+                break
+            else:
+                return fail
+    if skip_ws(buf, i) != n:
+        return fail
+    return out[:count], True
+
+
+# Compiled once per process (and cached on disk); None when numba is missing
+if njit is not None:
+    scan_xy_pairs = njit(cache=True, nogil=True)(_scan_xy_pairs)
+else:
+    scan_xy_pairs = None
+
+
+def parse_coords(cell: str) -> Optional[np.ndarray]:
+    """Parse a JSON-like coords string '[[x,y], ...]' into an (N, 2) float32 array.
+
+    Returns None if the cell is missing or holds no valid vertex.
+    """
+    if cell is None:
+        return None
+    if scan_xy_pairs is not None:
+        coords, ok = scan_xy_pairs(np.frombuffer(cell.encode(), dtype=np.uint8))
+        if ok:
+            return coords if len(coords) else None
+    try:
+        arr = json_loads(cell)
+    except Exception:
+        return None
+    # Fast path: a well-formed list of [x, y] pairs converts in one bulk C call,
+    # without building a tuple and two Python floats per vertex.
     try:
-        arr = json.loads(cell)
-        # Expect list of [x, y]
-        out: List[Tuple[float, float]] = []
-        for pair in arr:
-            if not isinstance(pair, (list, tuple)) or len(pair) != 2:
-                continue
-            x, y = pair
-            out.append((float(x), float(y)))
-        return out
+        a = np.asarray(arr, dtype=np.float32)
+        if a.ndim == 2 and a.shape[1] == 2 and not np.isnan(a).any():
+            return a
+    except (ValueError, TypeError):
+        pass
+    # Slow path: ragged or malformed input, keep only the valid pairs and let
+    # numpy cast them in bulk (a non-numeric or null value rejects the polygon)
+    try:
+        out = [pair for pair in arr if isinstance(pair, (list, tuple)) and len(pair) == 2]
+        if not out:
+            return None
+        a = np.array(out, dtype=np.float32)
+        # Pairs of lists (e.g. [[[1, 2], [3, 4]]]) cast to a 3-D array: reject those too
+        if a.ndim != 2 or np.isnan(a).any():
+            return None
+        return a
     except Exception:
-        return []
+        return None
+
+
+@lru_cache(maxsize=COORDS_CACHE_SIZE)
+def parse_coords_cached(cell: str) -> Optional[np.ndarray]:
+    """Memoized parse_coords; the returned arrays are shared, so read-only."""
+    coords = parse_coords(cell)
+    if coords is not None:
+        coords.flags.writeable = False
+    return coords
+
+
+def coords_to_list_arrays(parsed) -> Tuple[pa.ListArray, pa.ListArray]:
+    """Build the x_list/y_list columns from (N, 2) arrays as flat values + offsets.
+
+    pa.ListArray.from_arrays copies whole buffers instead of walking the
+    polygons vertex by vertex, and both columns share one offsets array.
+    """
+    lengths = np.fromiter((a.shape[0] for a in parsed), dtype=np.int32, count=len(parsed))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    # One pass over the polygons, then one transpose makes x and y contiguous
+    xs_flat, ys_flat = np.ascontiguousarray(np.concatenate(parsed).T)
+    offsets_arr = pa.array(offsets)
+    x_col = pa.ListArray.from_arrays(offsets_arr, pa.array(xs_flat))
+    y_col = pa.ListArray.from_arrays(offsets_arr, pa.array(ys_flat))
+    return x_col, y_col
+
+
+# Define the schema once, to be used for all files
+SCHEMA = pa.schema([
+    pa.field('x_list', pa.list_(pa.float32())),
+    pa.field('y_list', pa.list_(pa.float32())),
+    pa.field('plane_id', pa.uint16()),
+    pa.field('label', pa.int32())
+])
+
+# --dictionary-labels: label stored as dictionary<int32, int32>. Each shard
+# carries its own dictionary; the viewer expects plain int32 labels.
+DICT_LABEL_SCHEMA = SCHEMA.set(
+    SCHEMA.get_field_index("label"), pa.field("label", pa.dictionary(pa.int32(), pa.int32()))
+)
+
+
+def write_ipc_file(table: pa.Table, path: Path, comp, max_chunksize=None):
+    """Stream a table's record batches into an Arrow IPC file (Feather v2 on disk)."""
+    options = pa.ipc.IpcWriteOptions(compression=None if comp == "uncompressed" else comp)
+    with pa.OSFile(path.as_posix(), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=max_chunksize)
+
+
+def write_shard(table: pa.Table, outdir: Path, shard_name: str, comp, output_variant: str) -> dict:
+    """Write a shard; with --output-variant both also write an LZ4 sibling.
+
+    Returns the extra manifest fields for the shard entry.
+    """
+    write_ipc_file(table, outdir / shard_name, comp)
+    if output_variant != "both":
+        return {}
+    lz4_name = shard_name.replace(".feather", LZ4_SUFFIX)
+    write_ipc_file(table, outdir / lz4_name, "lz4", max_chunksize=LZ4_CHUNKSIZE)
+    return {"lz4_url": lz4_name}
+
+
+def build_plane_table(path: Path, dictionary_labels: bool = False, cache_coords: bool = False):
+    """Parse one plane TSV into its Arrow table (CPU-bound part, no I/O writes).
+
+    Returns (plane id, shard name, table, number of points, cache hits), or
+    None if the plane id cannot be parsed from the file name. Cache hits is
+    None unless cache_coords is set.
+    """
+    # Extract plane_id from filename, e.g., plane_42.tsv -> 42
+    match = re.search(r"(\d+)", path.name)
+    if not match:
+        print(f"Warning: could not parse plane ID from filename, skipping: {path.name}")
+        return None
+
+    current_plane_id = int(match.group(1))
+    shard_name = f"boundaries_plane_{current_plane_id:02d}.feather"
+    schema = DICT_LABEL_SCHEMA if dictionary_labels else SCHEMA
+
+    # Arrow's multi-threaded CSV reader fills typed columns directly, no pandas
+    table = pacsv.read_csv(
+        path,
+        parse_options=pacsv.ParseOptions(delimiter="\t"),
+        convert_options=pacsv.ConvertOptions(
+            column_types={"label": pa.int64(), "coords": pa.string()},
+            strings_can_be_null=True,
+        ),
+    )
+
+    # Parse every polygon into an (N, 2) array, dropping rows where parsing
+    # fails in the same pass
+    parse = parse_coords_cached if cache_coords else parse_coords
+    hits_before = parse_coords_cached.cache_info().hits
+    cells = table.column("coords").to_pylist()
+    keep = np.zeros(len(cells), dtype=bool)
+    parsed = []
+    for i, cell in enumerate(cells):
+        coords = parse(cell)
+        if coords is not None:
+            keep[i] = True
+            parsed.append(coords)
+    cache_hits = parse_coords_cached.cache_info().hits - hits_before if cache_coords else None
+
+    if not parsed:
+        # If file is empty or has no valid polygons, write an empty Feather file
+        # with the correct schema.
+        return current_plane_id, shard_name, schema.empty_table(), 0, cache_hits
+
+    # Prepare data for Arrow: flat vertex buffers, no per-vertex Python floats
+    x_col, y_col = coords_to_list_arrays(parsed)
+    labels = pc.fill_null(table.column("label").filter(pa.array(keep)), -1)
+    labels = labels.cast(pa.int32()).combine_chunks()
+    if dictionary_labels:
+        labels = labels.dictionary_encode()
+
+    # Create the Arrow table
+    arrays = {
+        "x_list": x_col,
+        "y_list": y_col,
+        # Constant per shard: fill a uint16 buffer directly instead of boxing a list
+        "plane_id": pa.array(np.full(len(parsed), current_plane_id, dtype=np.uint16)),
+        "label": labels,
+    }
+    table = pa.table(arrays, schema=schema)
+    # The offsets buffer already holds the vertex count, no need to re-sum
+    pts = x_col.offsets[-1].as_py()
+    return current_plane_id, shard_name, table, pts, cache_hits
+
+
+def format_cache_hits(cache_hits: Optional[int]) -> str:
+    """Log suffix for the per-plane lines; empty when --cache-coords is off."""
+    return "" if cache_hits is None else f", cached={cache_hits}"
+
+
+def write_plane(built, outdir: Path, comp, output_variant: str = "browser"):
+    """Write a table from build_plane_table; returns (shard manifest entry, number of points)."""
+    current_plane_id, shard_name, table, pts, cache_hits = built
+
+    # Write the Feather file
+    extra = write_shard(table, outdir, shard_name, comp, output_variant)
+
+    polys = table.num_rows
+    if polys == 0:
+        print(f"Wrote empty shard {shard_name} for plane {current_plane_id}")
+    else:
+        print(f"Wrote {shard_name}: polys={polys}, points={pts}{format_cache_hits(cache_hits)}")
+    return {"url": shard_name, "rows": int(polys), "plane": current_plane_id, **extra}, pts
+
+
+def process_plane(path: Path, outdir: Path, comp, output_variant: str = "browser",
+                  dictionary_labels: bool = False, cache_coords: bool = False):
+    """Convert one plane TSV into its Feather shard.
+
+    Returns (shard manifest entry, number of points), or None if the plane id
+    cannot be parsed from the file name.
+    """
+    built = build_plane_table(path, dictionary_labels, cache_coords)
+    if built is None:
+        return None
+    return write_plane(built, outdir, comp, output_variant)
+
+
+def iter_plane_tables(files, workers: int, cache_coords: bool = False):
+    """Yield build_plane_table results in file order.
+
+    With several workers, planes are built in worker processes, at most
+    `workers` planes ahead of the consumer so memory stays bounded.
+    """
+    if workers <= 1 or len(files) <= 1:
+        for path in files:
+            yield build_plane_table(path, cache_coords=cache_coords)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        window = deque()
+        for path in files:
+            window.append(ex.submit(build_plane_table, path, cache_coords=cache_coords))
+            if len(window) > workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def write_single_file(built_planes, outdir: Path, comp):
+    """Write every plane as one record batch of a single Arrow IPC stream.
+
+    Returns (shard manifest entry, number of points) per plane; each entry
+    carries the byte offset and length of its record batch.
+    """
+    options = pa.ipc.IpcWriteOptions(compression=None if comp == "uncompressed" else comp)
+    schema_length = len(SCHEMA.serialize())
+    results = []
+    with pa.OSFile((outdir / SINGLE_FILE_NAME).as_posix(), "wb") as sink:
+        with pa.ipc.new_stream(sink, SCHEMA, options=options) as writer:
+            for built in built_planes:
+                if built is None:
+                    continue
+                current_plane_id, _, table, pts, cache_hits = built
+                batches = table.combine_chunks().to_batches()
+                batch = batches[0] if batches else pa.RecordBatch.from_pylist([], schema=SCHEMA)
+                # The schema message is written together with the first batch
+                start = max(sink.tell(), schema_length)
+                writer.write_batch(batch)
+                entry = {
+                    "url": SINGLE_FILE_NAME,
+                    "rows": int(batch.num_rows),
+                    "plane": current_plane_id,
+                    "offset": start,
+                    "length": sink.tell() - start,
+                }
+                results.append((entry, pts))
+                print(f"Added plane {current_plane_id} to {SINGLE_FILE_NAME}: "
+                      f"polys={batch.num_rows}, points={pts}{format_cache_hits(cache_hits)}")
+    return results, schema_length
 
 
 def main():
@@ -80,75 +451,63 @@ def main():
     if not files:
         raise SystemExit(f"No files matched {indir}/{args.pattern}")
 
+    schema_length = None
+    if args.layout == "single":
+        if args.output_variant != "browser":
+            raise SystemExit("--output-variant both is only supported with --layout per-plane")
+        if args.dictionary_labels:
+            # The stream writer skips unchanged dictionaries, so a plane's byte
+            # range would not always be decodable on its own
+            raise SystemExit("--dictionary-labels is only supported with --layout per-plane")
+        results, schema_length = write_single_file(
+            iter_plane_tables(files, args.workers, args.cache_coords), outdir, comp
+        )
+    elif args.workers > 1 and len(files) > 1:
+        # Planes are independent and CPU-bound (JSON parsing + Arrow build), so
+        # convert them in separate processes. map() keeps the input file order.
+        worker = partial(process_plane, outdir=outdir, comp=comp, output_variant=args.output_variant,
+                         dictionary_labels=args.dictionary_labels, cache_coords=args.cache_coords)
+        with ProcessPoolExecutor(max_workers=args.workers) as ex:
+            results = list(ex.map(worker, files))
+    else:
+        # Serial: a writer thread writes plane N while plane N+1 is parsed.
+        # At most one write is pending, so only two tables are held at once.
+        results = []
+        pending = None
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            for path in files:
+                built = build_plane_table(path, args.dictionary_labels, args.cache_coords)
+                if pending is not None:
+                    results.append(pending.result())
+                pending = None
+                if built is not None:
+                    pending = writer.submit(write_plane, built, outdir, comp, args.output_variant)
+            if pending is not None:
+                results.append(pending.result())
+
     shards = []
     total_polys = 0
     total_points = 0
-
-    # Define the schema once, to be used for all files
-    schema = pa.schema([
-        pa.field('x_list', pa.list_(pa.float32())),
-        pa.field('y_list', pa.list_(pa.float32())),
-        pa.field('plane_id', pa.uint16()),
-        pa.field('label', pa.int32())
-    ])
-
-    for path in files:
-        # Extract plane_id from filename, e.g., plane_42.tsv -> 42
-        match = re.search(r"(\d+)", path.name)
-        if not match:
-            print(f"Warning: could not parse plane ID from filename, skipping: {path.name}")
+    for result in results:
+        if result is None:
             continue
-
-        current_plane_id = int(match.group(1))
-        shard_name = f"boundaries_plane_{current_plane_id:02d}.feather"
-
-        df = pd.read_csv(path, sep="\t", dtype={"label": "Int64", "coords": "string"})
-
-        # Use .apply for efficient parsing, drop rows where parsing fails
-        df["parsed_coords"] = df["coords"].apply(parse_coords)
-        df = df[df["parsed_coords"].str.len() > 0]
-
-        if df.empty:
-            # If file is empty or has no valid polygons, write an empty Feather file
-            # with the correct schema.
-            empty_table = schema.empty_table()
-            feather.write_feather(empty_table, (outdir / shard_name).as_posix(), compression=comp)
-            shards.append({"url": shard_name, "rows": 0, "plane": current_plane_id})
-            print(f"Wrote empty shard {shard_name} for plane {current_plane_id}")
-            continue
-
-        # Prepare data for Arrow
-        x_lists = df["parsed_coords"].apply(lambda coords: [float(x) for x, _ in coords])
-        y_lists = df["parsed_coords"].apply(lambda coords: [float(y) for _, y in coords])
-        labels = pd.to_numeric(df["label"], errors="coerce").fillna(-1).astype("int32")
-
-        # Create the Arrow table
-        arrays = {
-            "x_list": pa.array(x_lists, type=pa.list_(pa.float32())),
-            "y_list": pa.array(y_lists, type=pa.list_(pa.float32())),
-            "plane_id": pa.array([current_plane_id] * len(df), type=pa.uint16()),
-            "label": pa.array(labels, type=pa.int32()),
-        }
-        table = pa.table(arrays, schema=schema)
-
-        # Write the Feather file
-        feather.write_feather(table, (outdir / shard_name).as_posix(), compression=comp)
-
-        polys = len(df)
-        pts = sum(x_lists.str.len())
-        total_polys += polys
+        shard, pts = result
+        shards.append(shard)
+        total_polys += shard["rows"]
         total_points += pts
 
-        shards.append({"url": shard_name, "rows": int(polys), "plane": current_plane_id})
-        print(f"Wrote {shard_name}: polys={polys}, points={pts}")
-
     # Manifest
     manifest = {
-        "format": "arrow-feather",
+        "format": "arrow-feather" if schema_length is None else "arrow-stream",
         "total_rows": int(total_polys),
         "total_points": int(total_points),
         "shards": shards,
     }
+    if schema_length is not None:
+        manifest["schema_length"] = schema_length
+    if args.dictionary_labels:
+        # Dictionaries are built per plane, not shared across shards
+        manifest["label_dictionary_unified"] = False
     (outdir / "manifest.json").write_text(json.dumps(manifest, indent=2))
     print(f"Done. Total polys: {total_polys}. Total points: {total_points}. Files: {len(shards)}. Output: {outdir}")
 
@@ -8,16 +8,31 @@ Output directory: ./data/arrow_cells/
 Columns expected (subset OK):
   Cell_Num (int), X (float), Y (float), Z (float), ClassName (str), Prob (float/str), gaussian_contour (str)
 
-We dictionary-encode ClassName to class_id, and write both class_id (numeric) and ClassName (string)
-into the shards. Default shard size ~100k rows, compression uncompressed for web decoding.
+ClassName and Prob are written as list columns (class_name: list<string>, prob: list<float32>);
+no separate class dictionary is built. Default shard size ~100k rows, compression uncompressed
+for web decoding.
+--output-variant both additionally writes an LZ4-compressed *.lz4.feather sibling per
+shard (listed as lz4_url in the manifest) for non-browser consumers.
 """
 import argparse
 import json
 from pathlib import Path
 
-import pandas as pd
+import numpy as np
 import pyarrow as pa
-import pyarrow.feather as feather
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib parser
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# Sibling shards for local/server consumers that can decode compressed IPC
+LZ4_SUFFIX = ".lz4.feather"
+LZ4_CHUNKSIZE = 65536
 
 
 def build_argparser():
@@ -31,6 +46,13 @@ def build_argparser():
         choices=["uncompressed", "none", "zstd", "lz4"],
         help="Record batch compression for Feather v2. Use uncompressed/none for browser Arrow JS."
     )
+    p.add_argument(
+        "--output-variant",
+        default="browser",
+        choices=["browser", "both"],
+        help="'both' also writes an LZ4-compressed *.lz4.feather sibling per shard "
+             "(not readable by the browser viewer)."
+    )
     return p
 
 
@@ -38,63 +60,135 @@ def ensure_outdir(path: Path):
     path.mkdir(parents=True, exist_ok=True)
 
 
-def parse_list_column(series, parse_as='string'):
-    """Parse string representations of lists or native lists into actual Python lists"""
-    def parse_cell(cell_value):
-        if pd.isna(cell_value):
-            return []
-
-        # Handle case where it's already a list or tuple
-        if isinstance(cell_value, (list, tuple)):
-            if parse_as == 'float':
-                return [float(x) for x in cell_value]
-            else:
-                return [str(x) for x in cell_value]
-
-        # Handle string representation of lists
-        if isinstance(cell_value, str):
-            try:
-                # Handle both single quotes and double quotes in list strings
-                parsed = json.loads(cell_value.replace("'", '"'))
-                if isinstance(parsed, list):
-                    if parse_as == 'float':
-                        return [float(x) for x in parsed]
-                    else:
-                        return [str(x) for x in parsed]
-                else:
-                    return []
-            except (json.JSONDecodeError, ValueError, TypeError):
-                return []
-
+def write_ipc_file(table: pa.Table, path: Path, comp, max_chunksize=None):
+    """Stream a table's record batches into an Arrow IPC file (Feather v2 on disk)."""
+    options = pa.ipc.IpcWriteOptions(compression=None if comp == "uncompressed" else comp)
+    with pa.OSFile(path.as_posix(), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=max_chunksize)
+
+
+def write_shard(table: pa.Table, outdir: Path, shard_name: str, comp, output_variant: str) -> dict:
+    """Write a shard; with --output-variant both also write an LZ4 sibling.
+
+    Returns the extra manifest fields for the shard entry.
+    """
+    write_ipc_file(table, outdir / shard_name, comp)
+    if output_variant != "both":
+        return {}
+    lz4_name = shard_name.replace(".feather", LZ4_SUFFIX)
+    write_ipc_file(table, outdir / lz4_name, "lz4", max_chunksize=LZ4_CHUNKSIZE)
+    return {"lz4_url": lz4_name}
+
+
+def read_header(path: Path):
+    """Return the column names from the first line of a TSV file."""
+    with open(path, newline="") as f:
+        return f.readline().rstrip("\r\n").split("\t")
+
+
+def iter_row_chunks(reader, rows_per_chunk: int):
+    """Re-slice a streaming CSV reader's record batches into tables of rows_per_chunk rows.
+
+    The reader yields batches sized by bytes, not rows; the last table may be shorter.
+    """
+    pending = []
+    n_pending = 0
+    for batch in reader:
+        pending.append(batch)
+        n_pending += batch.num_rows
+        while n_pending >= rows_per_chunk:
+            table = pa.Table.from_batches(pending, schema=reader.schema)
+            yield table.slice(0, rows_per_chunk)
+            rest = table.slice(rows_per_chunk)
+            pending = rest.to_batches()
+            n_pending = rest.num_rows
+    if n_pending:
+        yield pa.Table.from_batches(pending, schema=reader.schema)
+
+
+def _parse_list_cell(cell_value):
+    """Decode one list cell ("['a', 'b']" or '[0.1, 0.2]'); [] if missing or malformed."""
+    if cell_value is None:
         return []
-
-    return series.apply(parse_cell)
-
-
-def select_cast_columns(df: pd.DataFrame) -> pd.DataFrame:
+    try:
+        # Handle both single quotes and double quotes in list strings
+        parsed = json_loads(cell_value.replace("'", '"'))
+    except (ValueError, TypeError):
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+def parse_list_column(column, parse_as='string') -> pa.ListArray:
+    """Parse a string column of list literals straight into an Arrow ListArray.
+
+    The cells are decoded in a single pass into one flat values list plus
+    offsets, so no per-row Python lists have to be re-boxed by pa.array.
+    For parse_as='float' the flat values are converted to float32 in bulk;
+    a row holding a non-numeric item becomes an empty list.
+    """
+    rows = [_parse_list_cell(cell) for cell in column.to_pylist()]
+    if parse_as == 'float':
+        try:
+            values = np.asarray([x for row in rows for x in row], dtype=np.float32)
+            if np.isnan(values).any():
+                raise ValueError("null or NaN list item")
+        except (ValueError, TypeError):
+            # Rare: some row has a non-numeric item, drop just those rows
+            rows = [row if _all_numeric(row) else [] for row in rows]
+            values = np.asarray([x for row in rows for x in row], dtype=np.float32)
+        values = pa.array(values)
+    else:
+        values = pa.array([str(x) for row in rows for x in row], type=pa.string())
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int32)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    return pa.ListArray.from_arrays(pa.array(offsets), values)
+
+
+def _all_numeric(row) -> bool:
+    try:
+        for x in row:
+            float(x)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+# Numeric columns are typed by the CSV reader itself, so text is parsed
+# straight into the target width with no float64 temporaries.
+NUMERIC_COLUMN_TYPES = {
+    "Cell_Num": pa.int32(),
+    "X": pa.float32(),
+    "Y": pa.float32(),
+    "Z": pa.float32(),
+}
+
+
+def select_cast_columns(table: pa.Table) -> pa.Table:
+    """Select and cast the shard columns from a CSV chunk, entirely in Arrow."""
+    names = table.column_names
     cols = {}
-    # Required / common
-    if "Cell_Num" in df.columns:
-        cols["cell_id"] = pd.to_numeric(df["Cell_Num"], errors="coerce").fillna(-1).astype("int32")
-    if "X" in df.columns: cols["X"] = pd.to_numeric(df["X"], errors="coerce").astype("float32")
-    if "Y" in df.columns: cols["Y"] = pd.to_numeric(df["Y"], errors="coerce").astype("float32")
-    if "Z" in df.columns: cols["Z"] = pd.to_numeric(df["Z"], errors="coerce").astype("float32")
+    # Required / common (numeric columns are already typed by the CSV reader)
+    if "Cell_Num" in names:
+        cols["cell_id"] = pc.fill_null(table.column("Cell_Num"), -1)
+    if "X" in names: cols["X"] = table.column("X")
+    if "Y" in names: cols["Y"] = table.column("Y")
+    if "Z" in names: cols["Z"] = table.column("Z")
 
     # Parse ClassName as list of strings
-    if "ClassName" in df.columns:
-        cols["class_name"] = parse_list_column(df["ClassName"], parse_as='string')
+    if "ClassName" in names:
+        cols["class_name"] = parse_list_column(table.column("ClassName"), parse_as='string')
 
     # Parse Prob as list of floats
-    if "Prob" in df.columns:
-        cols["prob"] = parse_list_column(df["Prob"], parse_as='float')
+    if "Prob" in names:
+        cols["prob"] = parse_list_column(table.column("Prob"), parse_as='float')
 
-    if "gaussian_contour" in df.columns:
-        cols["gaussian_contour"] = df["gaussian_contour"].astype("string")
-    # Optional passthroughs (keep as string)
-    for optional in ("sphere_scale", "sphere_rotation"):
-        if optional in df.columns:
-            cols[optional] = df[optional].astype("string")
-    return pd.DataFrame(cols)
+    # Passthroughs, read as strings by the CSV reader
+    for optional in ("gaussian_contour", "sphere_scale", "sphere_rotation"):
+        if optional in names:
+            cols[optional] = table.column(optional)
+    return pa.table(cols)
 
 
 def main():
@@ -111,37 +205,26 @@ def main():
     total_rows = 0
     shard_index = 0
 
-    reader = pd.read_csv(inp, sep="\t", dtype="string", chunksize=args.rows_per_shard)
-
-    for chunk in reader:
-        df = select_cast_columns(chunk)
-
-        arrays = {}
-        for col in df.columns:
-            if col in ('class_name', 'prob'):
-                # Handle list columns properly
-                if col == 'class_name':
-                    arrays[col] = pa.array(df[col].tolist(), type=pa.list_(pa.string()))
-                else:  # prob
-                    arrays[col] = pa.array(df[col].tolist(), type=pa.list_(pa.float32()))
-            elif pd.api.types.is_string_dtype(df[col]):
-                arrays[col] = pa.array(df[col].astype("string"))
-            elif pd.api.types.is_float_dtype(df[col]):
-                arrays[col] = pa.array(df[col].astype("float32"))
-            elif pd.api.types.is_integer_dtype(df[col]):
-                # choose smallest reasonable integer type
-                if str(df[col].dtype).startswith("int32"):
-                    arrays[col] = pa.array(df[col].astype("int32"))
-                else:
-                    arrays[col] = pa.array(df[col].astype("int64"))
-            else:
-                arrays[col] = pa.array(df[col])
-
-        table = pa.table(arrays)
+    # PyArrow's CSV reader parses blocks on several threads straight into Arrow
+    # buffers. Numeric columns get their final types, everything else is read
+    # as a (nullable) string, like dtype="string".
+    column_types = {name: pa.string() for name in read_header(inp)}
+    column_types.update(NUMERIC_COLUMN_TYPES)
+    reader = pacsv.open_csv(
+        inp,
+        parse_options=pacsv.ParseOptions(delimiter="\t"),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            strings_can_be_null=True,
+        ),
+    )
+
+    for chunk in iter_row_chunks(reader, args.rows_per_shard):
+        table = select_cast_columns(chunk)
         shard_name = f"cells_shard_{shard_index:03d}.feather"
-        feather.write_feather(table, (outdir / shard_name).as_posix(), compression=comp)
-        n = len(df)
-        shards.append({"url": shard_name, "rows": int(n)})
+        extra = write_shard(table, outdir, shard_name, comp, args.output_variant)
+        n = chunk.num_rows
+        shards.append({"url": shard_name, "rows": int(n), **extra})
         total_rows += n
         shard_index += 1
         print(f"Wrote {shard_name} with {n} rows")
@@ -0,0 +1,28 @@
+"""Regression tests for the boundary coords parser (run with pytest from python_converters/)."""
+import numpy as np
+
+import boundaries_tsv_to_arrow_shards as boundaries
+
+
+def test_parse_coords_well_formed():
+    coords = boundaries.parse_coords("[[1, 2.5], [3, 4]]")
+    assert coords.dtype == np.float32
+    assert coords.tolist() == [[1.0, 2.5], [3.0, 4.0]]
+
+
+def test_parse_coords_rejects_nested_pairs():
+    assert boundaries.parse_coords("[[[1, 2], [3, 4]]]") is None
+    assert boundaries.parse_coords("[[1, 2], [[3, 4], [5, 6]]]") is None
+
+
+def test_build_plane_table_drops_nested_pair_rows(tmp_path):
+    plane = tmp_path / "plane_07.tsv"
+    plane.write_text(
+        "plane_id\tlabel\tcoords\n"
+        "7\t1\t[[1, 2], [3, 4], [5, 6]]\n"
+        "7\t2\t[[[1, 2], [3, 4]]]\n"
+    )
+    plane_id, _, table, pts, _ = boundaries.build_plane_table(plane)
+    assert plane_id == 7
+    assert table.column("label").to_pylist() == [1]
+    assert pts == 3
@@ -10,10 +10,16 @@ Columns expected (subset is OK):
   gene_name (str), x (float), y (float), z (float), plane_id (int), spot_id (str/int), parent_cell_id (int)
   neighbour_array (JSON list<int>), neighbour_prob (JSON list<float>), omp_score (float), omp_intensity (float)
 
-We dictionary-encode gene_name to numeric gene_id and write both gene_id and gene_name
-into the Arrow shards. Shards are ~200k rows by default and compressed with zstd.
+gene_id is taken from the input; without a gene_id column (or with --build-gene-id),
+gene_name is dictionary-encoded into gene_id (ids follow the sorted gene names).
+Only gene_id goes into the Arrow shards.
+Shards are ~200k rows by default and uncompressed unless --compression is given.
+--output-variant both additionally writes a zstd-compressed Arrow IPC stream
+*.arrows sibling per shard (listed as stream_url) for non-browser consumers.
 
 Manifest produced: manifest.json with list of shard files and row counts.
+With --spatial-order the spots are sorted along a Z-order curve over (x, y) before
+sharding and each shard entry also carries x_min/x_max/y_min/y_max.
 Gene dictionary produced: gene_dict.json mapping gene_id -> gene_name.
 
 Usage:
@@ -24,14 +30,81 @@ Usage:
 """
 import argparse
 import json
+import mmap
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Optional
 
-import pandas as pd
+import numpy as np
 import pyarrow as pa
-import pyarrow.feather as feather
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import json as _json
 
+from _numscan import near_float32_tie, scan_number, skip_ws
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib parser
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # optional: list cells then go through the JSON parser only
+    njit = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# Bytes per CSV block handed to a parser thread (cut back to the last full row)
+READ_BLOCK_SIZE = 64 << 20
+# Upper bound for Arrow's I/O thread pool
+MAX_IO_THREADS = 8
+# Converted slices allowed to wait for the writer thread
+MAX_PENDING_WRITES = 4
+# Shard progress lines are flushed in groups rather than one syscall per shard
+PROGRESS_FLUSH_EVERY = 10
+# Used when --compression zstd is given without --compression-level
+ZSTD_DEFAULT_LEVEL = 3
+# Sibling shards for local/server consumers that can decode compressed IPC
+STREAM_SUFFIX = ".arrows"
+
+# Shard schema (column order and types); shards hold the subset present in the input
+SCHEMA = pa.schema([
+    pa.field("x", pa.float32()),
+    pa.field("y", pa.float32()),
+    pa.field("z", pa.float32()),
+    pa.field("plane_id", pa.uint16()),
+    pa.field("spot_id", pa.uint32()),
+    pa.field("parent_cell_id", pa.int32()),
+    pa.field("gene_id", pa.uint32()),
+    pa.field("neighbour_array", pa.list_(pa.int32())),
+    pa.field("neighbour_prob", pa.list_(pa.float32())),
+    pa.field("omp_score", pa.float32()),
+    pa.field("omp_intensity", pa.float32()),
+])
+
+# JSON list columns and their Arrow item types
+LIST_COLUMNS = {
+    "neighbour_array": pa.int32(),
+    "neighbour_prob": pa.float32(),
+}
+
+# The CSV reader parses scalar columns straight into their shard types; list
+# columns are read as (nullable) strings and gene_name only feeds gene_dict.json
+COLUMN_TYPES = {
+    field.name: pa.string() if field.name in LIST_COLUMNS else field.type for field in SCHEMA
+}
+COLUMN_TYPES["gene_name"] = pa.dictionary(pa.int32(), pa.string())
+
+# --coord-encoding int16: x/y/z are stored as round(value / scale) with
+# |code| <= INT16_MAX_CODE and <column>_scale in each record batch's metadata
+COORD_COLUMNS = ("x", "y", "z")
+INT16_MAX_CODE = 32760
+
 
 def build_argparser():
     p = argparse.ArgumentParser(description="TSV -> Arrow shards (Feather v2)")
@@ -44,6 +117,45 @@ def build_argparser():
         choices=["uncompressed", "none", "zstd", "lz4"],
         help="Record batch compression for Feather v2. Browser Arrow JS often cannot decode zstd/lz4; use uncompressed/none for web demos."
     )
+    p.add_argument(
+        "--output-variant",
+        default="browser",
+        choices=["browser", "both"],
+        help="'both' also writes a zstd-compressed *.arrows IPC stream sibling per shard "
+             "(not readable by the browser viewer)."
+    )
+    p.add_argument(
+        "--coord-encoding",
+        default="float32",
+        choices=["float32", "float16", "int16"],
+        help="Storage type for x/y/z. float16 (exact only up to 2048) and int16 with a per-batch "
+             "scale halve the coordinate bytes but are not readable by the browser viewer."
+    )
+    p.add_argument(
+        "--compression-level",
+        type=int,
+        default=None,
+        help=f"Codec level for zstd/lz4 (zstd default {ZSTD_DEFAULT_LEVEL}, lz4 uses the codec default)."
+    )
+    p.add_argument(
+        "--build-gene-id",
+        action="store_true",
+        help="Number genes from gene_name and ignore any gene_id column "
+             "(the default when the input has no gene_id)."
+    )
+    p.add_argument(
+        "--spatial-order",
+        action="store_true",
+        help="Sort all spots along a Z-order curve over (x, y) before sharding, so each shard "
+             "covers a compact region, and add x/y bounds per shard to the manifest. "
+             "Holds the whole converted table in memory."
+    )
+    p.add_argument(
+        "--threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Arrow CPU threads for CSV parsing and compression (default: all cores)."
+    )
     return p
 
 
@@ -51,139 +163,554 @@ def ensure_outdir(path: Path):
     path.mkdir(parents=True, exist_ok=True)
 
 
-def _parse_int_list(cell: str):
-    if pd.isna(cell):
+def encode_coords(table: pa.Table, encoding: str) -> pa.Table:
+    """Downcast the x/y/z columns for --coord-encoding float16/int16.
+
+    For int16 each column is scaled so its largest magnitude maps to
+    INT16_MAX_CODE; the value is recovered as code * <column>_scale.
+    """
+    if encoding == "float32":
+        return table
+    metadata = {}
+    for name in COORD_COLUMNS:
+        if name not in table.column_names:
+            continue
+        col = table.column(name)
+        if encoding == "float16":
+            col = col.cast(pa.float16())
+        else:
+            bounds = pc.min_max(col)
+            bound = max(abs(bounds["min"].as_py() or 0.0), abs(bounds["max"].as_py() or 0.0))
+            scale = bound / INT16_MAX_CODE if bound else 1.0
+            col = pc.round(pc.divide(col.cast(pa.float64()), scale)).cast(pa.int16())
+            metadata[f"{name}_scale"] = repr(scale)
+        table = table.set_column(table.schema.get_field_index(name), name, col)
+    return table.replace_schema_metadata(metadata) if metadata else table
+
+
+def make_write_options(comp, level=None) -> pa.ipc.IpcWriteOptions:
+    """IPC write options shared by all shards, so the codec is created only once."""
+    codec = None
+    if comp not in (None, "uncompressed"):
+        if level is None and comp == "zstd":
+            level = ZSTD_DEFAULT_LEVEL
+        codec = pa.Codec(comp, compression_level=level)
+    # use_threads compresses the column buffers in parallel
+    return pa.ipc.IpcWriteOptions(compression=codec, use_threads=True)
+
+
+def open_shard(path: Path, schema: pa.Schema, options: pa.ipc.IpcWriteOptions, stream: bool = False):
+    """Open an Arrow IPC writer that slices are appended to.
+
+    The file format (Feather v2 on disk) by default, the stream format with stream=True.
+    """
+    sink = pa.OSFile(path.as_posix(), "wb")
+    open_writer = pa.ipc.new_stream if stream else pa.ipc.new_file
+    return sink, open_writer(sink, schema, options=options)
+
+
+def write_slice(writer, table: pa.Table):
+    """Append a converted slice; slice-level metadata (int16 coord scales) goes on its batch."""
+    metadata = table.schema.metadata
+    for batch in table.replace_schema_metadata(None).to_batches():
+        writer.write_batch(batch, custom_metadata=metadata)
+
+
+def close_shard(sink, writer):
+    writer.close()
+    sink.close()
+
+
+def open_input(path: Path):
+    """Memory-map the input TSV for the CSV reader (no copy through Python file reads).
+
+    The mapping is marked for sequential access so the kernel reads ahead
+    aggressively and drops pages behind the parser.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_SEQUENTIAL"):  # Linux/macOS, Python >= 3.8
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return pa.BufferReader(pa.py_buffer(mapped))
+
+
+def write_json(path: Path, obj):
+    """Write obj as indented JSON (orjson when installed; int keys become strings either way)."""
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        path.write_text(json.dumps(obj, indent=2))
+
+
+def read_header(path: Path):
+    """Return the column names from the first line of a TSV file."""
+    with open(path, newline="") as f:
+        return f.readline().rstrip("\r\n").split("\t")
+
+
+def iter_shard_slices(reader, rows_per_shard: int):
+    """Yield (shard index, record batch), cutting the reader's batches at shard boundaries.
+
+    The reader yields batches sized by bytes, not rows; the last shard may be shorter.
+    """
+    shard_index = 0
+    rows_in_shard = 0
+    for batch in reader:
+        offset = 0
+        while offset < batch.num_rows:
+            n = min(rows_per_shard - rows_in_shard, batch.num_rows - offset)
+            yield shard_index, batch.slice(offset, n)
+            offset += n
+            rows_in_shard += n
+            if rows_in_shard == rows_per_shard:
+                shard_index += 1
+                rows_in_shard = 0
+
+
+def _parse_list(cell: str, conv):
+    """Decode one JSON list cell, converting items with conv; items conv rejects are skipped."""
+    if cell is None:
         return None
     try:
         v = _json.loads(cell)
-        if isinstance(v, list):
-            out = []
-            for x in v:
-                try:
-                    out.append(int(x))
-                except Exception:
-                    continue
-            return out
     except Exception:
         return None
-    return None
+    if not isinstance(v, list):
+        return None
+    out = []
+    for x in v:
+        try:
+            out.append(conv(x))
+        except Exception:
+            continue
+    return out
+
+
+_parse_int_list = partial(_parse_list, conv=int)
+_parse_float_list = partial(_parse_list, conv=float)
 
 
-def _parse_float_list(cell: str):
-    if pd.isna(cell):
+def _decode_lists(cells):
+    """Decode all non-null list cells with a single JSON parse.
+
+    Returns the decoded lists (one per non-null cell), or None if some cell
+    is not a plain JSON list and the per-row parsers have to decide.
+    """
+    present = [c for c in cells if c is not None]
+    if not all(c.lstrip().startswith("[") and c.rstrip().endswith("]") for c in present):
         return None
     try:
-        v = _json.loads(cell)
-        if isinstance(v, list):
-            out = []
-            for x in v:
-                try:
-                    out.append(float(x))
-                except Exception:
-                    continue
-            return out
-    except Exception:
+        rows = json_loads("[" + ",".join(present) + "]")
+    except ValueError:
         return None
-    return None
-
-
-def infer_and_cast(df: pd.DataFrame) -> pd.DataFrame:
-    # Select and cast a minimal set of columns; keep optional ones if present
-    cols = {}
-    if "x" in df.columns: cols["x"] = df["x"].astype("float32")
-    if "y" in df.columns: cols["y"] = df["y"].astype("float32")
-    if "z" in df.columns: cols["z"] = df["z"].astype("float32")
-    if "plane_id" in df.columns: cols["plane_id"] = df["plane_id"].astype("uint16", errors="ignore")
-    if "spot_id" in df.columns:
-        cols["spot_id"] = pd.to_numeric(df["spot_id"], errors="coerce").astype("uint32")
-    if "parent_cell_id" in df.columns:
-        cols["parent_cell_id"] = pd.to_numeric(df["parent_cell_id"], errors="coerce").fillna(-1).astype("int32")
-    if "gene_id" in df.columns:
-        cols["gene_id"] = pd.to_numeric(df["gene_id"], errors="coerce").astype("uint32")
-    # Note: gene_name removed from Arrow output - use gene_dict.json lookup with gene_id instead
-
-    # Optional neighbour/omp fields
-    if "neighbour_array" in df.columns:
-        cols["neighbour_array"] = df["neighbour_array"].apply(_parse_int_list)
-    if "neighbour_prob" in df.columns:
-        cols["neighbour_prob"] = df["neighbour_prob"].apply(_parse_float_list)
-    if "omp_score" in df.columns:
-        cols["omp_score"] = pd.to_numeric(df["omp_score"], errors="coerce").astype("float32")
-    if "omp_intensity" in df.columns:
-        cols["omp_intensity"] = pd.to_numeric(df["omp_intensity"], errors="coerce").astype("float32")
-
-    return pd.DataFrame(cols)
+    if len(rows) != len(present) or not all(isinstance(row, list) for row in rows):
+        return None
+    return rows
+
+
+def _scan_int(buf, i):
+    """Parse a plain JSON integer (at most 10 digits) at buf[i]; returns (value, next index, ok)."""
+    n = buf.shape[0]
+    neg = False
+    if i < n and buf[i] == 45:  # '-'
+        neg = True
+        i += 1
+    mant = 0
+    start = i
+    while i < n and 48 <= buf[i] <= 57:
+        mant = mant * 10 + (int(buf[i]) - 48)
+        i += 1
+    if i == start or i - start > 10 or (i - start > 1 and buf[start] == 48):
+        return 0.0, i, False
+    # A fraction or exponent makes it a float item: leave those to the JSON path
+    if i < n and (buf[i] == 46 or buf[i] == 101 or buf[i] == 69):
+        return 0.0, i, False
+    val = float(mant)
+    return (-val if neg else val), i, True
+
+
+def _scan_number_lists(data, offsets, valid, int_items):
+    """Parse every valid '[n, n, ...]' cell of an Arrow string array's buffers.
+
+    Returns (values, per-row lengths, ok); ok is False as soon as a cell is
+    not a flat list of plain numbers, and the caller falls back to JSON.
+    """
+    n_rows = offsets.shape[0] - 1
+    # Upper bound on the number of items: one per comma plus one per row
+    n_items = n_rows
+    for k in range(offsets[0], offsets[n_rows]):
+        if data[k] == 44:  # ','
+            n_items += 1
+    values = np.empty(n_items, dtype=np.float64)
+    lengths = np.zeros(n_rows, dtype=np.int64)
+    count = 0
+    for r in range(n_rows):
+        if not valid[r]:
+            continue
+        cell = data[offsets[r]:offsets[r + 1]]
+        n = cell.shape[0]
+        i = skip_ws(cell, 0)
+        if i >= n or cell[i] != 91:  # '['
+            return values[:0], lengths, False
+        i = skip_ws(cell, i + 1)
+        start_count = count
+        if i < n and cell[i] == 93:  # ']': empty list
+            i += 1
+        else:
+            while True:
+                if int_items:
+                    v, i, ok = _scan_int(cell, i)
+                else:
+                    v, i, ok = scan_number(cell, i)
+                    ok = ok and not near_float32_tie(v)
+                if not ok:
+                    return values[:0], lengths, False
+                values[count] = v
+                count += 1
+                i = skip_ws(cell, i)
+                if i < n and cell[i] == 44:  # ','
+                    i = skip_ws(cell, i + 1)
+                elif i < n and cell[i] == 93:  # ']'
+                    i += 1
+                    break
+                else:
+                    return values[:0], lengths, False
+        if skip_ws(cell, i) != n:
+            return values[:0], lengths, False
+        lengths[r] = count - start_count
+    return values[:count], lengths, True
+
+
+# Compiled once per process (and cached on disk); None when numba is missing
+if njit is not None:
+    _scan_int = njit(cache=True, nogil=True)(_scan_int)
+    scan_number_lists = njit(cache=True, nogil=True)(_scan_number_lists)
+else:
+    scan_number_lists = None
+
+
+def _scan_list_column(column: pa.Array, is_int: bool):
+    """Run scan_number_lists over the column's raw buffers; None if it bails out."""
+    if column.type != pa.string():
+        return None
+    _, offsets_buf, data_buf = column.buffers()
+    offsets = np.frombuffer(offsets_buf, dtype=np.int32)[column.offset:column.offset + len(column) + 1]
+    data = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None else np.empty(0, dtype=np.uint8)
+    valid = column.is_valid().to_numpy(zero_copy_only=False)
+    values, lengths, ok = scan_number_lists(data, offsets, valid, is_int)
+    return (values, lengths, valid) if ok else None
+
+
+def _decode_list_column(cells, is_int: bool):
+    """JSON-decode list cells into (values, per-row lengths, validity)."""
+    rows = _decode_lists(cells)
+    values = None
+    if rows is not None:
+        flat = [x for row in rows for x in row]
+        try:
+            values = np.asarray(flat) if flat else np.empty(0, dtype=np.int64)
+        except (ValueError, TypeError):  # nested lists
+            values = np.empty(0, dtype=object)
+        if values.ndim == 1 and values.dtype.kind in ("iub" if is_int else "iubf"):
+            decoded = iter(rows)
+            rows = [None if c is None else next(decoded) for c in cells]
+        else:
+            values = None
+    if values is None:
+        parse = _parse_int_list if is_int else _parse_float_list
+        rows = [parse(c) for c in cells]
+        values = np.asarray([x for row in rows if row for x in row],
+                            dtype=np.int64 if is_int else np.float64)
+    lengths = np.fromiter((len(row) if row is not None else 0 for row in rows), dtype=np.int64, count=len(rows))
+    valid = np.fromiter((row is not None for row in rows), dtype=bool, count=len(rows))
+    return values, lengths, valid
+
+
+def parse_list_column(column, value_type) -> pa.ListArray:
+    """Parse a string column of JSON lists into an Arrow ListArray.
+
+    With numba, flat lists of plain numbers are scanned straight from the
+    Arrow string buffers. Otherwise the whole column is decoded with one JSON
+    parse and its items are converted in bulk. If any cell is malformed or
+    holds a non-numeric item, every row goes through _parse_int_list /
+    _parse_float_list instead (null for bad cells, bad items skipped).
+    """
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    is_int = pa.types.is_integer(value_type)
+    parsed = _scan_list_column(column, is_int) if scan_number_lists is not None else None
+    if parsed is None:
+        parsed = _decode_list_column(column.to_pylist(), is_int)
+    values, lengths, valid = parsed
+
+    if is_int and values.size:
+        info = np.iinfo(np.int32)
+        if values.min() < info.min or values.max() > info.max:
+            raise OverflowError("list item out of int32 range")
+    with np.errstate(over="ignore"):  # out-of-range floats become +-inf, as with pa.array
+        values = np.ascontiguousarray(values, dtype=np.int32 if is_int else np.float32)
+
+    # Assemble the ListArray straight from NumPy buffers: offsets, values and a
+    # validity bitmap (only when some rows are null)
+    n = len(lengths)
+    offsets = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    null_count = n - int(valid.sum())
+    validity = pa.py_buffer(np.packbits(valid, bitorder="little")) if null_count else None
+    items = pa.Array.from_buffers(value_type, len(values), [None, pa.py_buffer(values)])
+    return pa.Array.from_buffers(
+        pa.list_(value_type), n, [validity, pa.py_buffer(offsets)],
+        null_count=null_count, children=[items],
+    )
+
+
+def read_gene_names(path: Path) -> pa.Array:
+    """Pre-pass over the gene_name column: every distinct name, sorted (gene_id = position)."""
+    reader = pacsv.open_csv(
+        open_input(path),
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=READ_BLOCK_SIZE),
+        parse_options=pacsv.ParseOptions(delimiter="\t"),
+        convert_options=pacsv.ConvertOptions(
+            column_types={"gene_name": COLUMN_TYPES["gene_name"]},
+            include_columns=["gene_name"],
+            strings_can_be_null=True,
+        ),
+    )
+    # Each batch's dictionary already holds just its distinct names
+    dictionaries = [batch.column(0).dictionary for batch in reader]
+    names = pa.chunked_array(dictionaries, type=pa.string()).unique()
+    return names.take(pc.sort_indices(names))
+
+
+def encode_gene_ids(gene_name, genes: pa.Array) -> pa.Array:
+    """Map the dictionary-encoded gene_name column to ids (positions in genes) as uint32.
+
+    Only the few dictionary entries are looked up; rows just gather their
+    entry's id. Missing names stay null.
+    """
+    names = pa.table({"gene_name": gene_name}).unify_dictionaries().combine_chunks().column("gene_name")
+    if names.num_chunks == 0:
+        return pa.array([], type=pa.uint32())
+    names = names.chunk(0)
+    codes = pc.index_in(names.dictionary, value_set=genes)
+    return pc.take(codes, names.indices).cast(pa.uint32())
+
+
+def chunk_gene_names(gene_id, gene_name) -> dict:
+    """Map gene_id -> gene_name for one chunk; the last name seen for an id wins.
+
+    gene_name is dictionary-encoded by the CSV reader, so the rows are reduced
+    per gene_id on the integer dictionary indices and only the few distinct
+    names are turned into Python strings.
+    """
+    pairs = pa.table({"gene_id": gene_id, "gene_name": gene_name}).unify_dictionaries().combine_chunks()
+    names = pairs.column("gene_name")
+    if names.num_chunks == 0:
+        return {}
+    names = names.chunk(0)
+    # Missing names map to "" (index -1)
+    codes = pa.table({"gene_id": pairs.column("gene_id"), "code": pc.fill_null(names.indices, -1)})
+    last = codes.group_by("gene_id", use_threads=False).aggregate([("code", "last")])
+    dictionary = names.dictionary.to_pylist()
+    return {
+        gid: dictionary[code] if code >= 0 else ""
+        for gid, code in zip(last.column("gene_id").to_pylist(), last.column("code_last").to_pylist())
+        if gid is not None
+    }
+
+
+def report_shard(shard: dict, n_done: int):
+    """Log a written shard; stdout is only flushed every PROGRESS_FLUSH_EVERY shards."""
+    sys.stdout.write(f"Wrote {shard['url']} with {shard['rows']} rows\n")
+    if n_done % PROGRESS_FLUSH_EVERY == 0:
+        sys.stdout.flush()
+
+
+def finish_shard(outputs, writes, shard: dict, n_done: int):
+    """Close a shard's writers, then log it unless one of its slice writes failed.
+
+    Runs on the writer thread, which executes tasks in order, so every write
+    in writes has completed by now.
+    """
+    for sink, writer in outputs:
+        close_shard(sink, writer)
+    for write in writes:
+        write.result()  # a failed write is re-raised here instead of being logged
+    report_shard(shard, n_done)
+
+
+def convert_batch(batch: pa.RecordBatch, genes: Optional[pa.Array]) -> pa.Table:
+    """Convert one CSV record batch into a shard slice.
+
+    genes is None when gene_id comes from the input; otherwise gene ids are
+    looked up from gene_name (see encode_gene_ids).
+    """
+    columns = {name: batch.column(name) for name in SCHEMA.names if name in batch.column_names}
+    for col, value_type in LIST_COLUMNS.items():
+        if col in columns:
+            columns[col] = parse_list_column(columns[col], value_type)
+    if genes is not None:
+        columns["gene_id"] = encode_gene_ids(batch.column("gene_name"), genes)
+    if "parent_cell_id" in columns:
+        columns["parent_cell_id"] = pc.fill_null(columns["parent_cell_id"], -1)
+    shard_schema = pa.schema([field for field in SCHEMA if field.name in columns])
+    return pa.table([columns[name] for name in shard_schema.names], schema=shard_schema)
+
+
+def iter_converted_slices(slices, genes: Optional[pa.Array], gene_dict: dict):
+    """Convert (shard index, batch) slices.
+
+    When gene_id comes from the input, gene_id -> gene_name is collected into gene_dict.
+    """
+    for shard_index, batch in slices:
+        table = convert_batch(batch, genes)
+        if genes is None and "gene_id" in table.column_names and "gene_name" in batch.column_names:
+            gene_dict.update(chunk_gene_names(table.column("gene_id"), batch.column("gene_name")))
+        yield shard_index, table
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Spread the low 16 bits of v so that bit i moves to bit 2*i."""
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    return (v | (v << 1)) & 0x55555555
+
+
+def morton_order(table: pa.Table) -> np.ndarray:
+    """Row order along a Z-order (Morton) curve over the x/y bounding box."""
+    codes = np.zeros(table.num_rows, dtype=np.uint32)
+    for shift, name in enumerate(("x", "y")):
+        v = table.column(name).to_numpy().astype(np.float64)  # nulls -> NaN
+        finite = v[np.isfinite(v)]
+        lo, hi = (finite.min(), finite.max()) if finite.size else (0.0, 0.0)
+        v = np.where(np.isnan(v), lo, v)
+        q = (v - lo) * (65535.0 / (hi - lo)) if hi > lo else np.zeros_like(v)
+        # +-inf land on the edges of the box
+        codes |= _spread_bits(np.clip(q, 0.0, 65535.0).astype(np.uint32)) << shift
+    return np.argsort(codes, kind="stable")
+
+
+def spatially_ordered(slices, rows_per_shard: int):
+    """Collect every converted slice, sort all rows by morton_order and re-cut the shards."""
+    tables = [table for _, table in slices]
+    if not tables:
+        return
+    table = pa.concat_tables(tables)
+    table = table.take(pa.array(morton_order(table)))
+    for shard_index, start in enumerate(range(0, table.num_rows, rows_per_shard)):
+        yield shard_index, table.slice(start, rows_per_shard)
+
+
+def coord_bounds(table: pa.Table) -> dict:
+    """x/y bounding box of a shard for the manifest (lets a client skip off-screen shards)."""
+    bounds = {}
+    for name in ("x", "y"):
+        min_max = pc.min_max(table.column(name))
+        bounds[f"{name}_min"] = min_max["min"].as_py()
+        bounds[f"{name}_max"] = min_max["max"].as_py()
+    return bounds
 
 
 def main():
     args = build_argparser().parse_args()
+    # Size Arrow's pools explicitly: the CPU pool parses CSV blocks and
+    # compresses buffers, the I/O pool reads ahead of the parser
+    pa.set_cpu_count(max(1, args.threads))
+    pa.set_io_thread_count(min(MAX_IO_THREADS, max(1, args.threads)))
     inp = Path(args.input)
     outdir = Path(args.outdir)
     ensure_outdir(outdir)
 
     shards = []
     total_rows = 0
-    shard_index = 0
-    gene_dict_data = None  # Will store gene_id -> gene_name mapping
-
-    # Read TSV in chunks to avoid high memory usage
-    reader = pd.read_csv(inp, sep="\t", dtype="string", chunksize=args.rows_per_shard)
+    gene_dict_data = {}  # Will store gene_id -> gene_name mapping
+
+    # Stream the TSV through PyArrow's multi-threaded CSV reader: numeric columns
+    # are parsed straight into their final Arrow types, only the columns used
+    # below are materialised.
+    header = read_header(inp)
+    column_types = {name: t for name, t in COLUMN_TYPES.items() if name in header}
+
+    if args.spatial_order and not {"x", "y"} <= set(header):
+        raise SystemExit("--spatial-order needs x and y columns")
+
+    # Either trust the input gene_id column or number the genes here (decided once).
+    # Numbered genes come from a pre-pass, so the dictionary is final before any
+    # shard is written and ids follow the sorted gene names.
+    genes = None
+    if args.build_gene_id or "gene_id" not in header:
+        if "gene_name" in header:
+            genes = read_gene_names(inp)
+            gene_dict_data.update(enumerate(genes.to_pylist()))
+            column_types.pop("gene_id", None)
+        elif args.build_gene_id:
+            raise SystemExit("--build-gene-id needs a gene_name column")
+    reader = pacsv.open_csv(
+        open_input(inp),
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=READ_BLOCK_SIZE),
+        parse_options=pacsv.ParseOptions(delimiter="\t"),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            include_columns=[name for name in header if name in column_types],
+            strings_can_be_null=True,
+        ),
+    )
 
     # Map CLI compression to pyarrow parameter
     comp = args.compression
     if comp == "none":
         comp = None
-
-    for chunk in reader:
-        # Accumulate gene dictionary from all chunks
-        if "gene_id" in chunk.columns and "gene_name" in chunk.columns:
-            if gene_dict_data is None:
-                gene_dict_data = {}
-
-            # Add genes from this chunk
-            chunk_gene_dict = dict(zip(pd.to_numeric(chunk["gene_id"], errors="coerce").fillna(0).astype(int),
-                                     chunk["gene_name"].fillna("")))
-            gene_dict_data.update(chunk_gene_dict)
-
-        df = infer_and_cast(chunk)
-
-        # Arrow schema with explicit types
-        arrays = {}
-        for col in df.columns:
-            # Convert pandas string dtype to pyarrow string, numeric to matching pa types
-            if col in ("neighbour_array", "neighbour_prob"):
-                # Build list arrays explicitly
-                if col == "neighbour_array":
-                    arrays[col] = pa.array(df[col].tolist(), type=pa.list_(pa.int32()))
-                else:
-                    arrays[col] = pa.array(df[col].tolist(), type=pa.list_(pa.float32()))
-            elif pd.api.types.is_string_dtype(df[col]):
-                arrays[col] = pa.array(df[col].astype("string"))
-            elif pd.api.types.is_float_dtype(df[col]):
-                arrays[col] = pa.array(df[col].astype("float32"))
-            elif pd.api.types.is_integer_dtype(df[col]):
-                # Use the smallest arrow type compatible with pandas dtype
-                if str(df[col].dtype).startswith("uint16"):
-                    arrays[col] = pa.array(df[col].astype("uint16"))
-                elif str(df[col].dtype).startswith("uint32"):
-                    arrays[col] = pa.array(df[col].astype("uint32"))
-                elif str(df[col].dtype).startswith("int32"):
-                    arrays[col] = pa.array(df[col].astype("int32"))
-                else:
-                    arrays[col] = pa.array(df[col].astype("int64"))
-            else:
-                arrays[col] = pa.array(df[col])
-
-        table = pa.table(arrays)
-        shard_name = f"spots_shard_{shard_index:03d}.feather"
-        shard_path = outdir / shard_name
-        feather.write_feather(table, shard_path.as_posix(), compression=comp)
-
-        row_count = len(df)
-        shards.append({"url": shard_name, "rows": int(row_count)})
-        total_rows += row_count
-        shard_index += 1
-        print(f"Wrote {shard_name} with {row_count} rows")
+    write_options = make_write_options(comp, args.compression_level)
+    stream_options = make_write_options("zstd") if args.output_variant == "both" else None
+
+    # Slices are converted as the CSV reader produces them and appended to the
+    # open shard by a writer thread (PyArrow releases the GIL while encoding and
+    # writing), so no shard is ever held in memory as a whole. The semaphore
+    # caps the number of slices waiting to be written.
+    in_flight = threading.BoundedSemaphore(MAX_PENDING_WRITES)
+    futures = []
+
+    def submit(fn, *fn_args):
+        in_flight.acquire()
+        future = pool.submit(fn, *fn_args)
+        future.add_done_callback(lambda _: in_flight.release())
+        futures.append(future)
+        return future
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        outputs = []  # (sink, writer) of the open shard and its stream sibling
+        writes = []  # the open shard's slice writes
+        slices = iter_converted_slices(
+            iter_shard_slices(reader, args.rows_per_shard), genes, gene_dict_data
+        )
+        if args.spatial_order:
+            slices = spatially_ordered(slices, args.rows_per_shard)
+        for shard_index, table in slices:
+            # With --spatial-order a slice is a whole shard, bounded before encoding
+            bounds = coord_bounds(table) if args.spatial_order else {}
+            table = encode_coords(table, args.coord_encoding)
+            if shard_index == len(shards):
+                if outputs:
+                    submit(finish_shard, outputs, writes, shards[-1], len(shards))
+                writes = []
+                shard_name = f"spots_shard_{shard_index:03d}.feather"
+                schema = table.schema.remove_metadata()
+                outputs = [open_shard(outdir / shard_name, schema, write_options)]
+                shards.append({"url": shard_name, "rows": 0, **bounds})
+                if stream_options is not None:
+                    stream_name = shard_name.replace(".feather", STREAM_SUFFIX)
+                    outputs.append(open_shard(outdir / stream_name, schema, stream_options, stream=True))
+                    shards[-1]["stream_url"] = stream_name
+            for _, writer in outputs:
+                writes.append(submit(write_slice, writer, table))
+            shards[-1]["rows"] += table.num_rows
+            total_rows += table.num_rows
+
+        if outputs:
+            submit(finish_shard, outputs, writes, shards[-1], len(shards))
+        for future in futures:
+            future.result()  # re-raise write errors
 
     # Write manifest
     manifest = {
@@ -191,13 +718,17 @@ def main():
         "total_rows": int(total_rows),
         "shards": shards,
     }
-    (outdir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    if args.coord_encoding != "float32":
+        manifest["coord_encoding"] = args.coord_encoding
+    if args.spatial_order:
+        manifest["spatial_order"] = "morton"
+    write_json(outdir / "manifest.json", manifest)
 
     # Write gene dictionary (id -> name) - sort by key and deduplicate
     if gene_dict_data:
         # Sort by gene_id and ensure unique mappings
         sorted_gene_dict = dict(sorted(gene_dict_data.items()))
-        (outdir / "gene_dict.json").write_text(json.dumps(sorted_gene_dict, indent=2))
+        write_json(outdir / "gene_dict.json", sorted_gene_dict)
         print(f"Gene dictionary: {len(sorted_gene_dict)} unique genes")
 
     print(f"Done. Total rows: {total_rows}. Shards: {len(shards)}. Output dir: {outdir}")